@@ -1,20 +1,52 @@
 # filter.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import anyio
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from app.utils.db import get_db
-from app.utils.models import User, Recipient_lists, Inputs, Results
+from app.utils.db import get_db, SessionLocal
+from app.utils.models import User, Recipient_lists, Inputs, Results, Jobs
 from app.utils.auth import get_current_user
-from app.utils.call_gpt import call_gpt
+from app.utils.call_gpt import call_gpt, build_shared_payload
+from app.utils.tracing import tracer
+from app.utils.prescreen import prescreen_draft, prescreen_stats
+from app.utils.idempotency import (
+    request_fingerprint,
+    claim_idempotency_key,
+    complete_idempotency_key,
+    release_idempotency_key,
+)
 from pydantic import BaseModel
+import os
 import uuid
+import asyncio
+import logging
+import functools
 from datetime import datetime
 from typing import Optional, Any, Dict, List
 
-from app.tasks.filter import process_external_request_task
+from app.tasks.filter import (
+    process_external_request_task,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    JOB_FAILED,
+)
+
+logger = logging.getLogger(__name__)
 
 app = APIRouter()
 
+# 그룹 메일 모드에서 서버 전체(프로세스 단위)에서 동시에 진행할 call_gpt 호출 수
+GROUP_MAIL_CONCURRENCY = int(os.getenv("GROUP_MAIL_CONCURRENCY", "5"))
+# 그룹 메일 전용 스레드 제한: 기본 스레드풀(인증 등 동기 의존성과 공유)을 점유하지 않도록 분리
+# 이벤트 루프 안에서만 만들 수 있으므로 처음 사용할 때 생성
+_group_mail_limiter = None
+# 응답과 독립적으로 실행 중인 그룹 메일 작업 (가비지 컬렉션 방지용 참조)
+_background_tasks = set()
+
 class FilterKeywordSchema(BaseModel):
     """유저가 제외할 키워드 목록"""
     filter_keywords: List[str] = None
@@ -34,14 +66,60 @@ class ExternalResultSchema(BaseModel):
     """외부 API 호출 결과"""
     result: Dict[str, Any]
 
+class GroupRequestSchema(BaseModel):
+    """그룹 메일: 하나의 초안을 그룹(또는 이메일 목록)의 수신자별로 맞춤 수정"""
+    title: str = None
+    data: str = None
+    guide: str = None
+    option: str = None
+    language: str = None
+    group: Optional[str] = None
+    recipients: Optional[List[str]] = None
+    stream: bool = False
+
+class GroupResultItem(BaseModel):
+    """수신자 한 명에 대한 결과"""
+    recipient: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class GroupResultSchema(BaseModel):
+    results: List[GroupResultItem]
+
+# 사전 검사로 바로 처리되어 Celery 작업이 없는 경우의 task_id 값
+PRESCREENED_TASK_ID = "prescreened"
+
 class JobCreateResponse(BaseModel):
     job_id: str
-    task_id: str
+    task_id: str  # 사전 검사로 바로 처리된 경우 PRESCREENED_TASK_ID
 
 class JobPollResponse(BaseModel):
     status: str  # PENDING | SUCCESS | FAILURE
+    state: Optional[str] = None  # QUEUED | RUNNING | SUCCEEDED | FAILED
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    time_created: Optional[datetime] = None
+    time_started: Optional[datetime] = None
+    time_finished: Optional[datetime] = None
+
+class JobSummary(BaseModel):
+    job_id: str
+    state: str
+    error: Optional[str] = None
+    time_created: datetime
+    time_started: Optional[datetime] = None
+    time_finished: Optional[datetime] = None
+
+class JobListResponse(BaseModel):
+    jobs: List[JobSummary]
+
+# jobs.status → 기존 폴링 응답의 status 값
+JOB_POLL_STATUS = {
+    JOB_QUEUED: "PENDING",
+    JOB_RUNNING: "PENDING",
+    JOB_SUCCEEDED: "SUCCESS",
+    JOB_FAILED: "FAILURE",
+}
 
 @app.get("/keywords", response_model=FilterKeywordSchema)
 async def get_filter_keywords(
@@ -106,11 +184,41 @@ async def update_filter_keywords(
 
     return FilterKeywordSchema(filter_keywords=user.filter_keyword)
 
+@app.get("/prescreen/stats")
+async def get_prescreen_stats(current_user_id = Depends(get_current_user)):
+    """사전 검사 빠른 경로 적중률과 절약한 모델 지연시간
+    이 요청을 처리한 API 프로세스의 값이며, 기준 지연시간은 PRESCREEN_MODEL_LATENCY_SECONDS 설정값을 우선 사용"""
+    return prescreen_stats.snapshot()
+
 @app.post("/", response_model=ExternalResultSchema)
-async def process_external_request(payload: ExternalRequestSchema, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def process_external_request(
+    payload: ExternalRequestSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     if payload.email == None and payload.guide == None:
         raise HTTPException(status_code=400, detail="Server received empty request")
 
+    # 같은 Idempotency-Key로 재시도된 요청이면 원래 응답을 그대로 반환
+    claim_token = None
+    if idempotency_key:
+        fingerprint = request_fingerprint("filter", payload.dict())
+        done, claim_token = await claim_idempotency_key(db, current_user, idempotency_key, fingerprint)
+        if done:
+            return ExternalResultSchema(**done.response_data)
+
+    try:
+        return _process_external_request(payload, db, current_user, idempotency_key, claim_token)
+    except Exception:
+        if idempotency_key:
+            release_idempotency_key(db, current_user, idempotency_key, claim_token)
+        raise
+
+
+def _process_external_request(
+    payload: ExternalRequestSchema, db: Session, current_user, idempotency_key: Optional[str], claim_token: Optional[str]
+):
     input_id = uuid.uuid4()
     input_row = Inputs(
         id=input_id,
@@ -121,10 +229,12 @@ async def process_external_request(payload: ExternalRequestSchema, db: Session =
 
     recipient = None
     if payload.recipient:
-        if recipient_data := db.query(Recipient_lists).filter(
-            Recipient_lists.email == payload.recipient,
-            Recipient_lists.user_id == current_user,
-        ).first():
+        with tracer.start_as_current_span("filter.recipient_lookup"):
+            recipient_data = db.query(Recipient_lists).filter(
+                Recipient_lists.email == payload.recipient,
+                Recipient_lists.user_id == current_user,
+            ).first()
+        if recipient_data:
             recipient = {
                 "name": recipient_data.recipient_name,
                 "group": recipient_data.recipient_group,
@@ -135,29 +245,192 @@ async def process_external_request(payload: ExternalRequestSchema, db: Session =
     db.add(input_row)
     db.flush()  # input_row가 세션에 반영되도록
 
+    # 수정이 필요 없는 초안은 모델 호출 없이 바로 반환
+    result_data = prescreen_draft(payload.title, payload.data, payload.guide, recipient, payload.filter_keywords)
+    if result_data is None:
+        result_data = call_gpt(payload.data, payload.guide, recipient)
+
     result_row = Results(
         id=uuid.uuid4(),
-        result_data=call_gpt(payload.data, payload.guide, recipient),
+        result_data=result_data,
         time_returned=datetime.utcnow(),
         input_id=input_row.id,
     )
     
-    db.add(result_row)
-    db.commit()
-    db.refresh(result_row)
+    response = ExternalResultSchema(result=result_row.result_data)
+
+    with tracer.start_as_current_span("filter.db_write"):
+        db.add(result_row)
+        if idempotency_key:
+            # 결과 저장과 같은 트랜잭션에서 키를 완료 처리
+            complete_idempotency_key(db, current_user, idempotency_key, claim_token, response.dict())
+        db.commit()
 
     # 4. API 응답으로 외부 API 결과 반환
-    return ExternalResultSchema(result=result_row.result_data)
+    return response
+
+@app.post("/group", response_model=GroupResultSchema)
+async def process_group_request(
+    payload: GroupRequestSchema,
+    db: Session = Depends(get_db),
+    current_user_id = Depends(get_current_user),
+):
+    if payload.data is None and payload.guide is None:
+        raise HTTPException(status_code=400, detail="Server received empty request")
+    if not payload.group and not payload.recipients:
+        raise HTTPException(status_code=400, detail="Either group or recipients is required")
+
+    # 수신자 전체를 한 번의 쿼리로 조회
+    conditions = []
+    if payload.group:
+        conditions.append(Recipient_lists.recipient_group == payload.group)
+    if payload.recipients:
+        conditions.append(Recipient_lists.email.in_(payload.recipients))
+    with tracer.start_as_current_span("filter.recipient_lookup"):
+        rows = (
+            db.query(Recipient_lists)
+            .filter(
+                Recipient_lists.user_id == current_user_id,
+                Recipient_lists.email.isnot(None),
+                or_(*conditions),
+            )
+            .all()
+        )
+    if not rows:
+        raise HTTPException(status_code=404, detail="No recipients found")
+
+    # 같은 이메일의 중복 주소록 항목은 한 번만 호출
+    recipients = {}
+    for r in rows:
+        recipients.setdefault(r.email, {"id": r.id, "email": r.email, "name": r.recipient_name, "group": r.recipient_group})
+    recipients = list(recipients.values())
+    found = {r["email"] for r in recipients}
+    missing = [email for email in dict.fromkeys(payload.recipients or []) if email not in found]
+
+    # 수신자와 무관한 프롬프트 부분은 한 번만 생성
+    shared_payload = build_shared_payload(payload.data, payload.guide)
+    limiter = _get_group_mail_limiter()
+    queue = asyncio.Queue()  # 끝나는 순서대로 스트림에 전달
+
+    async def personalize(recipient: dict):
+        try:
+            result = await anyio.to_thread.run_sync(
+                functools.partial(
+                    call_gpt,
+                    recipient={"name": recipient["name"], "group": recipient["group"]},
+                    shared_payload=shared_payload,
+                ),
+                limiter=limiter,
+            )
+            item = (recipient, result, None)
+        except Exception:
+            # 외부 API 오류 내용은 로그에만 남기고 클라이언트에는 고정 메시지 전달
+            logger.exception("Group mail generation failed (recipient_id=%s)", recipient["id"])
+            item = (recipient, None, "Failed to generate mail")
+        await queue.put(item)
+        return item
+
+    async def fan_out():
+        # 응답과 독립적으로 실행되므로 클라이언트가 끊겨도 이미 호출한 결과는 모두 저장
+        try:
+            finished = await asyncio.gather(*(personalize(r) for r in recipients))
+            await run_in_threadpool(_save_group_results, payload, finished)
+            return finished
+        except Exception:
+            logger.exception("Group mail fan-out failed")
+            raise
+        finally:
+            await queue.put(None)
+
+    fan_out_task = asyncio.create_task(fan_out())
+    _background_tasks.add(fan_out_task)
+    fan_out_task.add_done_callback(_background_tasks.discard)
+
+    if payload.stream:
+        async def stream_results():
+            for item in missing:
+                yield GroupResultItem(recipient=item, error="Recipient not found").json() + "\n"
+            while (item := await queue.get()) is not None:
+                recipient, result, error = item
+                yield GroupResultItem(recipient=recipient["email"], result=result, error=error).json() + "\n"
+
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    finished = await asyncio.shield(fan_out_task)
+
+    return GroupResultSchema(results=[
+        *[GroupResultItem(recipient=item, error="Recipient not found") for item in missing],
+        *[GroupResultItem(recipient=r["email"], result=result, error=error) for r, result, error in finished],
+    ])
+
+
+def _get_group_mail_limiter():
+    global _group_mail_limiter
+    if _group_mail_limiter is None:
+        _group_mail_limiter = anyio.CapacityLimiter(GROUP_MAIL_CONCURRENCY)
+    return _group_mail_limiter
+
+
+def _save_group_results(payload: GroupRequestSchema, finished: list):
+    """그룹 메일 결과를 inputs/results 테이블에 한 번의 트랜잭션으로 저장 (요청 세션과 별개의 세션 사용)"""
+    now = datetime.utcnow()
+    input_rows, result_rows = [], []
+    for recipient, result, error in finished:
+        input_row = Inputs(
+            id=str(uuid.uuid4()),
+            input_data={**payload.dict(exclude={"stream"}), "recipient": recipient["email"]},
+            time_requested=now,
+            recipient_id=recipient["id"],
+            recipient_email=recipient["email"],
+        )
+        input_rows.append(input_row)
+        if error is None:
+            result_rows.append(Results(
+                id=str(uuid.uuid4()),
+                result_data=result,
+                time_returned=now,
+                input_id=input_row.id,
+            ))
+
+    db = SessionLocal()
+    try:
+        with tracer.start_as_current_span("filter.db_write"):
+            db.add_all(input_rows)
+            db.flush()  # inputs가 먼저 반영되도록 (results FK)
+            db.add_all(result_rows)
+            db.commit()
+    finally:
+        db.close()
 
 @app.post("/job", response_model=JobCreateResponse)
 async def enqueue_job(
     payload: ExternalRequestSchema,
     db: Session = Depends(get_db),
     current_user_id = Depends(get_current_user), 
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
     if payload.email is None and payload.guide is None:
         raise HTTPException(status_code=400, detail="Server received empty request")
 
+    # 같은 Idempotency-Key로 재시도된 요청이면 원래 job id를 그대로 반환 (작업을 다시 넣지 않음)
+    claim_token = None
+    if idempotency_key:
+        fingerprint = request_fingerprint("filter.job", payload.dict())
+        done, claim_token = await claim_idempotency_key(db, current_user_id, idempotency_key, fingerprint)
+        if done:
+            return JobCreateResponse(**done.response_data)
+
+    try:
+        return _enqueue_job(payload, db, current_user_id, idempotency_key, claim_token)
+    except Exception:
+        if idempotency_key:
+            release_idempotency_key(db, current_user_id, idempotency_key, claim_token)
+        raise
+
+
+def _enqueue_job(
+    payload: ExternalRequestSchema, db: Session, current_user_id, idempotency_key: Optional[str], claim_token: Optional[str]
+):
     input_id = uuid.uuid4()
 
     input_row = Inputs(
@@ -169,25 +442,70 @@ async def enqueue_job(
 
     # recipient 매핑(기존 로직 유지)
     if payload.recipient:
-        recipient_data = (
-            db.query(Recipient_lists)
-            .filter(
-                Recipient_lists.email == payload.recipient,
-                Recipient_lists.user_id == current_user_id,
+        with tracer.start_as_current_span("filter.recipient_lookup"):
+            recipient_data = (
+                db.query(Recipient_lists)
+                .filter(
+                    Recipient_lists.email == payload.recipient,
+                    Recipient_lists.user_id == current_user_id,
+                )
+                .first()
             )
-            .first()
-        )
         if recipient_data:
             input_row.recipient_id = recipient_data.id
 
+    now = datetime.utcnow()
+    job_row = Jobs(
+        id=str(input_id),
+        user_id=current_user_id,
+        status=JOB_QUEUED,
+        time_created=now,
+    )
+
     db.add(input_row)
+    db.flush()  # jobs/results의 FK가 inputs를 참조하므로 먼저 반영
+
+    # 수정이 필요 없는 초안은 작업을 넣지 않고 결과를 바로 저장
+    if (result_data := prescreen_draft(
+        payload.title, payload.data, payload.guide, input_row.recipient_id, payload.filter_keywords
+    )) is not None:
+        db.add(Results(
+            id=uuid.uuid4(),
+            result_data=result_data,
+            time_returned=now,
+            input_id=input_row.id,
+        ))
+        job_row.status = JOB_SUCCEEDED
+        job_row.time_started = now
+        job_row.time_finished = now
+        db.add(job_row)
+        response = JobCreateResponse(job_id=str(input_id), task_id=PRESCREENED_TASK_ID)
+    else:
+        # 워커가 jobs row를 찾을 수 있도록 enqueue 전에 커밋
+        task_id = str(uuid.uuid4())
+        job_row.task_id = task_id
+        db.add(job_row)
+        db.commit()
+
+        # Celery task enqueue
+        try:
+            process_external_request_task.apply_async(
+                args=[str(input_id), str(current_user_id)],
+                task_id=task_id,
+            )
+        except Exception as e:
+            job_row.status = JOB_FAILED
+            job_row.error = str(e) or e.__class__.__name__
+            job_row.time_finished = datetime.utcnow()
+            db.commit()
+            raise
+        response = JobCreateResponse(job_id=str(input_id), task_id=task_id)
+
+    if idempotency_key:
+        complete_idempotency_key(db, current_user_id, idempotency_key, claim_token, response.dict(), job_id=str(input_id))
     db.commit()
-    db.refresh(input_row)
 
-    # Celery task enqueue
-    async_result = process_external_request_task.delay(str(input_id), str(current_user_id), db)
-
-    return JobCreateResponse(job_id=str(input_id), task_id=async_result.id)
+    return response
 
 @app.get("/job/{job_id}", response_model=JobPollResponse)
 async def poll_job(
@@ -195,21 +513,52 @@ async def poll_job(
     db: Session = Depends(get_db),
     current_user_id = Depends(get_current_user),
 ):
-    result_row = (
-        db.query(Results)
-        .filter(Results.input_id == job_id)
+    # jobs 기본키 조회 한 번 (완료된 경우 결과도 같은 쿼리로)
+    row = (
+        db.query(Jobs, Results.result_data)
+        .outerjoin(Results, Results.input_id == Jobs.id)
+        .filter(Jobs.id == job_id, Jobs.user_id == current_user_id)
         .first()
     )
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    if result_row:
-        return JobPollResponse(status="SUCCESS", result=result_row.result_data)
-
-    input_exists = (
-        db.query(Inputs)
-        .filter(Inputs.id == job_id)
-        .first()
+    job, result_data = row
+    return JobPollResponse(
+        status=JOB_POLL_STATUS[job.status],
+        state=job.status,
+        result=result_data if job.status == JOB_SUCCEEDED else None,
+        error=job.error,
+        time_created=job.time_created,
+        time_started=job.time_started,
+        time_finished=job.time_finished,
     )
-    if not input_exists:
-        raise HTTPException(status_code=404, detail="Job not found")
 
-    return JobPollResponse(status="PENDING")
\ No newline at end of file
+@app.get("/jobs", response_model=JobListResponse)
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user_id = Depends(get_current_user),
+):
+    """최근 작업 목록 (status로 QUEUED/RUNNING 등 필터링 가능)
+    status 지정 시 (user_id, status, time_created), 미지정 시 (user_id, time_created) 인덱스 사용"""
+    query = db.query(Jobs).filter(Jobs.user_id == current_user_id)
+    if status:
+        status = status.upper()
+        if status not in JOB_POLL_STATUS:
+            raise HTTPException(status_code=400, detail=f"Invalid status: must be one of {', '.join(JOB_POLL_STATUS)}")
+        query = query.filter(Jobs.status == status)
+    jobs = query.order_by(Jobs.time_created.desc()).limit(min(max(limit, 1), 100)).all()
+
+    return JobListResponse(jobs=[
+        JobSummary(
+            job_id=job.id,
+            state=job.status,
+            error=job.error,
+            time_created=job.time_created,
+            time_started=job.time_started,
+            time_finished=job.time_finished,
+        )
+        for job in jobs
+    ])
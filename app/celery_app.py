@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 
@@ -22,3 +23,22 @@ celery_app.conf.update(
     task_reject_on_worker_lost=True,
     worker_prefetch_multiplier=1,
 )
+
+
+# prefork 풀: 워커 프로세스가 fork된 후 트레이싱 설정 (API에서 전파된 컨텍스트를 이어받음)
+@worker_process_init.connect(weak=False)
+def init_worker_tracing(*args, **kwargs):
+    from app.utils.tracing import setup_tracing
+    setup_tracing("dearai-worker")
+
+
+# solo / threads / gevent / eventlet 풀: 자식 프로세스가 없으므로 worker_process_init이 호출되지 않음
+# (prefork는 fork 전에 설정하면 익스포터/파일이 자식과 공유되므로 위 시그널에서 설정)
+@worker_init.connect(weak=False)
+def init_worker_tracing_without_fork(sender=None, **kwargs):
+    pool_cls = getattr(sender, "pool_cls", None) or celery_app.conf.worker_pool
+    pool_name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, "__module__", "")
+    if "prefork" in pool_name:
+        return
+    from app.utils.tracing import setup_tracing
+    setup_tracing("dearai-worker")
@@ -1,8 +1,10 @@
 from fastapi import FastAPI
-from app.utils.auth import login, auth_callback
+from app.utils.auth import login, auth_callback, refresh, logout
 from app.apis.contacts import app as contact_router
 from app.apis.filter import app as filter_router
+from app.utils.tracing import setup_tracing
 from fastapi.middleware.cors import CORSMiddleware
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from dotenv import load_dotenv
 import os
 
@@ -12,6 +14,10 @@ EXTENSION_ID=os.getenv("EXTENSION_ID")
 
 app = FastAPI()
 
+# 트레이싱 (라우터 핸들러별 스팬은 FastAPIInstrumentor가 생성)
+setup_tracing("dearai-api")
+FastAPIInstrumentor.instrument_app(app)
+
 # 크롬 익스텐션의 ID를 아래처럼 실제 확장ID로 지정합니다.
 origins = [
     "https://dearai.cspark.my",
@@ -29,5 +35,7 @@ app.add_middleware(
 # 라우터 연결
 app.add_api_route("/login", login, methods=["GET"])
 app.add_api_route("/auth/callback", auth_callback, methods=["GET"])
+app.add_api_route("/auth/refresh", refresh, methods=["POST"])
+app.add_api_route("/auth/logout", logout, methods=["POST"])
 app.include_router(contact_router, prefix="/contacts", tags=["contact"])
 app.include_router(filter_router, prefix="/filter", tags=["filter"])
\ No newline at end of file
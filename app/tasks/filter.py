@@ -2,18 +2,43 @@
 import uuid
 from datetime import datetime
 from celery.utils.log import get_task_logger
-from sqlalchemy.orm import Session
 
 from app.celery_app import celery_app
 from app.utils.call_gpt import call_gpt
-from app.utils.models import Inputs, Results, Recipient_lists
-from app.utils.db import get_db
+from app.utils.models import Inputs, Results, Recipient_lists, Jobs
+from app.utils.db import SessionLocal
+from app.utils.tracing import tracer
+from opentelemetry import trace
 
 logger = get_task_logger(__name__)
 
+# jobs.status 값
+JOB_QUEUED = "QUEUED"
+JOB_RUNNING = "RUNNING"
+JOB_SUCCEEDED = "SUCCEEDED"
+JOB_FAILED = "FAILED"
+
 @celery_app.task(bind=True, name="filter.process_external_request")
-def process_external_request_task(self, input_id: str, user_id: str, db: Session) -> dict:
+def process_external_request_task(self, input_id: str, user_id: str) -> dict:
+    # Celery 실행 스팬은 CeleryInstrumentor가 생성하며, API의 트레이스 컨텍스트를 헤더로 이어받음
+    trace.get_current_span().set_attribute("dearai.input_id", input_id)
+    # Session은 메시지로 직렬화할 수 없으므로 워커에서 직접 생성
+    db = SessionLocal()
     try:
+        job = db.query(Jobs).filter(Jobs.id == input_id).first()
+        if not job:
+            raise ValueError(f"Job not found: {input_id}")
+
+        # acks_late로 재전달된 경우 이미 끝난 작업은 다시 실행하지 않음
+        if job.status == JOB_SUCCEEDED:
+            result_row = db.query(Results).filter(Results.input_id == input_id).first()
+            return result_row.result_data if result_row else None
+
+        job.status = JOB_RUNNING
+        job.time_started = datetime.utcnow()
+        job.error = None
+        db.commit()
+
         input_row = (
             db.query(Inputs)
             .filter(Inputs.id == input_id)
@@ -46,15 +71,25 @@ def process_external_request_task(self, input_id: str, user_id: str, db: Session
             input_id=input_row.id,
         )
 
-        db.add(result_row)
-        db.commit()
-        db.refresh(result_row)
+        with tracer.start_as_current_span("filter.db_write"):
+            db.add(result_row)
+            job.status = JOB_SUCCEEDED
+            job.time_finished = result_row.time_returned
+            db.commit()
+            db.refresh(result_row)
 
         return result_row.result_data  # ExternalResultSchema.result에 해당하는 dict
 
-    except Exception:
+    except Exception as e:
         db.rollback()
         logger.exception("Task failed (input_id=%s)", input_id)
+        # 실패 상태 기록 (PENDING으로 남지 않도록)
+        db.query(Jobs).filter(Jobs.id == input_id).update({
+            Jobs.status: JOB_FAILED,
+            Jobs.error: str(e) or e.__class__.__name__,
+            Jobs.time_finished: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
         raise
     finally:
         db.close()
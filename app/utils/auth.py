@@ -4,7 +4,11 @@ from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.utils.db import get_db
-from app.utils.models import User
+from app.utils.models import User, Revoked_tokens
+from app.utils.revocation import revocation_filter, rotated_tokens, known_users
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from app.utils.tracing import tracer
 import os
 from dotenv import load_dotenv
 import uuid
@@ -94,11 +98,13 @@ def create_access_token(userinfo: dict):
     payload["user_id"] = userinfo.get("user_id")  # user_id 추가
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
-def create_refresh_token(userinfo: dict):
+def create_refresh_token(userinfo: dict, sid: str = None):
     expiration = datetime.datetime.utcnow() + datetime.timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     payload = userinfo.copy()
     payload["exp"] = expiration
     payload["type"] = "refresh"
+    payload["sid"] = sid or str(uuid.uuid4())  # 로그인 세션 id (회전해도 유지, 폐기 단위)
+    payload["jti"] = str(uuid.uuid4())  # 토큰마다 새로 발급 (재사용 감지용)
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 # -------------------------
@@ -116,11 +122,13 @@ def decode_jwt(token: str):
 # 현재 사용자 가져오기
 # -------------------------
 def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_jwt(token)
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token: user_id missing")
-    return user_id
+    with tracer.start_as_current_span("auth.get_current_user") as span:
+        payload = decode_jwt(token)
+        user_id = payload.get("user_id")
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token: user_id missing")
+        span.set_attribute("enduser.id", user_id)
+        return user_id
 
 # -------------------------
 # 로그인 엔드포인트
@@ -214,3 +222,93 @@ def refresh_access_token(refresh_token: str):
     if payload.get("type") != "refresh":
         raise HTTPException(status_code=401, detail="Invalid token type")
     return create_access_token({"email": payload["email"], "user_id": payload["user_id"]})
+
+# -------------------------
+# refresh token 세션 폐기 (로그아웃 / 재사용 감지 / 관리자)
+# -------------------------
+def revoke_refresh_session(db: Session, user_id: str, sid: str, reason: str):
+    now = datetime.datetime.utcnow()
+    db.add(Revoked_tokens(
+        sid=sid,
+        user_id=user_id,
+        reason=reason,
+        time_revoked=now,
+        # 세션에서 마지막으로 발급됐을 수 있는 토큰이 만료될 때까지 보관
+        time_expires=now + datetime.timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # 이미 폐기된 세션
+    revocation_filter.add(sid)
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# -------------------------
+# 토큰 재발급 엔드포인트
+# 폐기 여부는 메모리 필터, 사용자 존재 여부는 캐시로 확인하므로 일반적인 경우 DB를 조회/기록하지 않음
+# 주의: 엄밀한 refresh token 회전(rotation)이 아님
+#   - 재발급 후에도 이전 refresh token은 서명/만료(exp)만 검사되므로, 이 요청을 처리한 프로세스 밖
+#     (다른 워커 프로세스, API 재시작·배포 이후)에서는 만료까지 계속 유효함
+#   - 재사용 감지는 같은 프로세스 안에서만 동작 (유예 시간 안의 재요청은 같은 토큰을 반환, 그 뒤 재사용은 세션 폐기)
+#   - 확실한 무효화는 세션 폐기(로그아웃/관리자, revoked_tokens)로만 보장되며 최대 REVOCATION_REBUILD_SECONDS 지연
+# -------------------------
+def refresh(body: RefreshRequest, db: Session = Depends(get_db)):
+    payload = decode_jwt(body.refresh_token)
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid token type")
+
+    user_id = payload["user_id"]
+    userinfo = {"email": payload["email"], "user_id": user_id}
+    sid = payload.get("sid")
+    if sid is None:
+        # sid 도입 전에 발급된 토큰은 user.refresh_token 컬럼과 비교 후 새 세션으로 전환
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user or user.refresh_token != body.refresh_token:
+            raise HTTPException(status_code=401, detail="Refresh token revoked")
+        user.refresh_token = None
+        db.commit()
+        known_users.mark(user_id)
+        return {
+            "access_token": create_access_token(userinfo),
+            "refresh_token": create_refresh_token(userinfo),
+        }
+
+    # 메모리 필터에 없으면 DB 조회 없이 통과, 있으면(오탐 가능) 테이블에서 확인
+    if revocation_filter.might_be_revoked(sid) and (
+        db.query(Revoked_tokens).filter(Revoked_tokens.sid == sid).first()
+    ):
+        raise HTTPException(status_code=401, detail="Refresh token revoked")
+
+    if not known_users.is_fresh(user_id):
+        if not db.query(User.id).filter(User.id == user_id).first():
+            raise HTTPException(status_code=401, detail="User not found")
+        known_users.mark(user_id)
+
+    tokens = rotated_tokens.get_or_rotate(payload["jti"], lambda: {
+        "access_token": create_access_token(userinfo),
+        "refresh_token": create_refresh_token(userinfo, sid),
+    })
+    if tokens is None:
+        # 유예 시간이 지난 뒤 이미 재발급된 토큰이 다시 사용됨 → 탈취로 보고 세션 전체 폐기
+        revoke_refresh_session(db, user_id, sid, "reuse")
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected")
+    return tokens
+
+# -------------------------
+# 로그아웃 엔드포인트 (refresh token 세션 폐기)
+# -------------------------
+def logout(body: RefreshRequest, db: Session = Depends(get_db)):
+    payload = decode_jwt(body.refresh_token)
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid token type")
+
+    if sid := payload.get("sid"):
+        revoke_refresh_session(db, payload["user_id"], sid, "logout")
+    else:
+        user = db.query(User).filter(User.id == payload["user_id"]).first()
+        if user and user.refresh_token == body.refresh_token:
+            user.refresh_token = None
+            db.commit()
+    return {"message": "logged out"}
@@ -1,57 +1,81 @@
 import os
 import json
+import time
 from dotenv import load_dotenv
 from openai import OpenAI
 from pydantic import BaseModel
+from app.utils.tracing import tracer
+from app.utils.prescreen import prescreen_stats
 
 # .env 로드
 load_dotenv()
 
+# 모델 호출 1회의 제한 시간과 재시도 횟수 (최악의 경우 timeout * (retries + 1) 동안 실행)
+GPT_TIMEOUT_SECONDS = float(os.getenv("GPT_TIMEOUT_SECONDS", "60"))
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "2"))
+
 # OpenAI 클라이언트 초기화 (환경변수 OPENAI_API_KEY 사용 권장)
-client = OpenAI(api_key=os.getenv("GPT_API_KEY"))
+client = OpenAI(api_key=os.getenv("GPT_API_KEY"), timeout=GPT_TIMEOUT_SECONDS, max_retries=GPT_MAX_RETRIES)
 
 # Pydantic 출력 스키마
 class ai_result(BaseModel):
     title: str
     mail: str
 
-def call_gpt(text = None, guide = None, recipient: dict=None):
-    payload = {
+# --- 핵심 변경: JSON을 진짜 JSON으로 전달 ---
+# 1) user content에 JSON 문자열을 그대로 넣음 (ensure_ascii=False로 한글 보존)
+# 2) system 프롬프트는 role만 사용 (불필요한 "System:" 접두어 제거)
+
+SYSTEM_PROMPT = (
+    "You are a supervisor responsible for managing email communications. "
+    "Your goal is to proactively prevent any issues staff may encounter in emails. "
+    "Your response should be a structured output: revise and improve both the 'title' and 'mail' fields "
+    "in your structured output based on the input's title and mail content. "
+    "If 'recipient' field is not None, consider who is the recipient of mail while revising the title and the mail."
+    "If there is no 'title' field, create title that best matches."
+    "If there is no 'mail' field, create mail content following provided guide."
+    "If there is a guide provided in the input, reflect any guidance for revising both the title and the mail based on the guide. "
+    "Modify the output language according to the input's specified language. "
+    "Review and revise both the email's title and content to ensure there are no inappropriate expressions. "
+    "After making revisions, briefly validate that both the email title and content are appropriate and clear, "
+    "and proceed or self-correct if validation fails. Respond in the language specified by the input."
+)
+
+# 수신자와 무관한 공통 입력 (그룹 메일에서는 한 번만 만들어 수신자별 호출에 재사용)
+def build_shared_payload(text = None, guide = None):
+    return {
         "language": "Korean",
         "mail": text,
         "guide": guide,
-        "recipient": recipient
     }
 
-    # --- 핵심 변경: JSON을 진짜 JSON으로 전달 ---
-    # 1) user content에 JSON 문자열을 그대로 넣음 (ensure_ascii=False로 한글 보존)
-    # 2) system 프롬프트는 role만 사용 (불필요한 "System:" 접두어 제거)
-
-    system_prompt = (
-        "You are a supervisor responsible for managing email communications. "
-        "Your goal is to proactively prevent any issues staff may encounter in emails. "
-        "Your response should be a structured output: revise and improve both the 'title' and 'mail' fields "
-        "in your structured output based on the input's title and mail content. "
-        "If 'recipient' field is not None, consider who is the recipient of mail while revising the title and the mail."
-        "If there is no 'title' field, create title that best matches."
-        "If there is no 'mail' field, create mail content following provided guide."
-        "If there is a guide provided in the input, reflect any guidance for revising both the title and the mail based on the guide. "
-        "Modify the output language according to the input's specified language. "
-        "Review and revise both the email's title and content to ensure there are no inappropriate expressions. "
-        "After making revisions, briefly validate that both the email title and content are appropriate and clear, "
-        "and proceed or self-correct if validation fails. Respond in the language specified by the input."
-    )
+def call_gpt(text = None, guide = None, recipient: dict=None, shared_payload: dict=None):
+    payload = {
+        **(shared_payload or build_shared_payload(text, guide)),
+        "recipient": recipient
+    }
 
     # 모델은 최신 SDK 예시와 호환되는 gpt-4o 계열 권장
     # 참고: SDK README의 Responses API 예시들 (responses.create, input 사용법) :contentReference[oaicite:3]{index=3}
-    response = client.responses.parse(
-        model="gpt-4o-mini",
-        input=[
-            {"role": "system", "content": system_prompt},
-            # JSON을 유효한 형태(쌍따옴표)로 직렬화해서 전달
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
-        ],
-        text_format=ai_result,
-    )
+    with tracer.start_as_current_span("call_gpt") as span:
+        span.set_attribute("gen_ai.request.model", "gpt-4o-mini")
+        span.set_attribute("dearai.has_recipient", recipient is not None)
+        started = time.perf_counter()
+        response = client.responses.parse(
+            model="gpt-4o-mini",
+            input=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                # JSON을 유효한 형태(쌍따옴표)로 직렬화해서 전달
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+            ],
+            text_format=ai_result,
+        )
+        # 사전 검사로 절약한 시간 추정에 사용
+        prescreen_stats.record_model_latency(time.perf_counter() - started)
+        # 토큰 사용량 기록 (스트리밍이 아니므로 스팬 길이 = 첫 토큰까지의 시간 포함 전체 모델 시간)
+        if usage := getattr(response, "usage", None):
+            span.set_attribute("gen_ai.usage.input_tokens", usage.input_tokens)
+            span.set_attribute("gen_ai.usage.output_tokens", usage.output_tokens)
+            span.set_attribute("gen_ai.usage.total_tokens", usage.total_tokens)
 
     return response.output_parsed.dict()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.utils.models import Idempotency_keys
+from app.utils.call_gpt import GPT_TIMEOUT_SECONDS, GPT_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# idempotency_keys.idempotency_key 컬럼 길이
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# 완료된 응답을 재사용하는 기간
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# 처리 중(IN_PROGRESS) 키의 선점 유지 시간. 처리하던 프로세스가 죽어도 이 시간이 지나면 다른 요청이 다시 선점
+# 처리 중에 만료되지 않도록 call_gpt의 최대 실행 시간(제한 시간 x 시도 횟수)보다 항상 길게 유지
+IDEMPOTENCY_LOCK_SECONDS = max(
+    int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "0")),
+    int(GPT_TIMEOUT_SECONDS * (GPT_MAX_RETRIES + 1)) + 60,
+)
+# 동시에 들어온 중복 요청이 첫 요청의 완료를 기다리는 최대 시간
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+IDEMPOTENCY_POLL_INTERVAL = 0.2
+# 만료된 키 정리 주기(프로세스 단위)와 한 번에 지우는 최대 행 수
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "60"))
+IDEMPOTENCY_PURGE_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", "1000"))
+
+_last_purge = 0.0
+
+STATUS_IN_PROGRESS = "IN_PROGRESS"
+STATUS_COMPLETED = "COMPLETED"
+
+
+# -------------------------
+# 요청 지문 (엔드포인트 + 페이로드)
+# -------------------------
+def request_fingerprint(scope: str, payload: dict) -> str:
+    body = json.dumps({"scope": scope, "payload": payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _query_key(db: Session, user_id: str, key: str):
+    return db.query(Idempotency_keys).filter(
+        Idempotency_keys.user_id == user_id,
+        Idempotency_keys.idempotency_key == key,
+    )
+
+
+# -------------------------
+# 만료된 키 정리
+# 클라이언트는 요청마다 새 키를 쓰므로 같은 키가 다시 오기를 기다리지 않고,
+# 선점 경로에서 주기적으로 time_expires 인덱스를 이용해 일정 개수씩 삭제
+# -------------------------
+def purge_expired_idempotency_keys(db: Session):
+    global _last_purge
+    if time.monotonic() - _last_purge < IDEMPOTENCY_PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = time.monotonic()
+    try:
+        deleted = db.execute(
+            text("DELETE FROM idempotency_keys WHERE time_expires <= :now LIMIT :limit"),
+            {"now": datetime.utcnow(), "limit": IDEMPOTENCY_PURGE_BATCH_SIZE},
+        ).rowcount
+        db.commit()
+        if deleted:
+            logger.info(f"Purged {deleted} expired idempotency keys")
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to purge expired idempotency keys")
+
+
+# -------------------------
+# 키 선점
+# 처음 들어온 요청이면 키를 선점하고 (None, 선점 토큰)을 반환,
+# 이미 처리된 요청이면 (저장된 row, None)을 반환 (새 DB 쓰기/모델 호출 없이 응답 재사용)
+# -------------------------
+async def claim_idempotency_key(db: Session, user_id: str, key: str, fingerprint: str):
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
+
+    purge_expired_idempotency_keys(db)
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        row = _query_key(db, user_id, key).first()
+
+        now = datetime.utcnow()
+        if row and row.time_expires <= now:
+            # 만료된 키(또는 처리 중 죽은 요청의 선점)는 지우고 새로 선점
+            _query_key(db, user_id, key).filter(Idempotency_keys.time_expires <= now).delete(synchronize_session=False)
+            db.commit()
+            row = None
+
+        if row is None:
+            claim_token = str(uuid.uuid4())
+            db.add(Idempotency_keys(
+                user_id=user_id,
+                idempotency_key=key,
+                fingerprint=fingerprint,
+                claim_token=claim_token,
+                status=STATUS_IN_PROGRESS,
+                time_created=now,
+                time_expires=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            ))
+            try:
+                db.commit()
+                return None, claim_token
+            except IntegrityError:
+                # 동시에 들어온 다른 요청이 먼저 선점함 → 그 요청의 결과를 기다림
+                db.rollback()
+                continue
+
+        if row.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was reused with a different request")
+
+        if row.status == STATUS_COMPLETED:
+            return row, None
+
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+        db.rollback()  # 트랜잭션 스냅샷을 비워 다음 조회에서 최신 상태를 읽도록
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+# -------------------------
+# 처리 완료 기록 (commit은 호출한 쪽에서 결과 저장과 함께 수행)
+# 선점 토큰이 일치할 때만 기록 → 선점이 만료되어 다른 요청이 다시 선점한 row는 덮어쓰지 않음
+# -------------------------
+def complete_idempotency_key(db: Session, user_id: str, key: str, claim_token: str, response_data: dict, job_id: Optional[str] = None):
+    row = _query_key(db, user_id, key).filter(Idempotency_keys.claim_token == claim_token).first()
+    if not row:
+        logger.warning(f"Idempotency-Key claim lost before completion (user_id={user_id}, key={key})")
+        return
+    row.status = STATUS_COMPLETED
+    row.response_data = response_data
+    row.job_id = job_id
+    row.time_expires = datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+
+
+# -------------------------
+# 처리 실패 시 선점 해제 (재시도가 다시 처리될 수 있도록)
+# -------------------------
+def release_idempotency_key(db: Session, user_id: str, key: str, claim_token: str):
+    db.rollback()
+    _query_key(db, user_id, key).filter(
+        Idempotency_keys.claim_token == claim_token,
+        Idempotency_keys.status == STATUS_IN_PROGRESS,
+    ).delete(synchronize_session=False)
+    db.commit()
@@ -18,7 +18,7 @@ Base = automap_base()
 
 # 메타데이터 설정
 metadata = MetaData()
-metadata.reflect(engine, only=['user', 'recipient_lists', 'inputs', 'results'])
+metadata.reflect(engine, only=['user', 'recipient_lists', 'inputs', 'results', 'idempotency_keys', 'revoked_tokens', 'jobs'])
 
 Base.prepare(engine, reflect=True)
 
@@ -26,4 +26,7 @@ Base.prepare(engine, reflect=True)
 User = Base.classes.user
 Recipient_lists = Base.classes.recipient_lists
 Inputs = Base.classes.inputs
-Results = Base.classes.results
\ No newline at end of file
+Results = Base.classes.results
+Idempotency_keys = Base.classes.idempotency_keys
+Revoked_tokens = Base.classes.revoked_tokens
+Jobs = Base.classes.jobs
\ No newline at end of file
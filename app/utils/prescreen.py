@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import logging
+import importlib
+import threading
+from typing import Optional, List
+from dotenv import load_dotenv
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# 사전 검사(pre-screen) 환경 변수
+# 기존 클라이언트의 동작이 바뀌므로 기본값은 꺼짐
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "false").lower() == "true"
+# 이 길이(문자 수)를 넘는 본문은 항상 모델로 보냄
+PRESCREEN_MAX_CHARS = int(os.getenv("PRESCREEN_MAX_CHARS", "300"))
+# 기본 목록에 더할 부적절 표현 (쉼표로 구분)
+PRESCREEN_BLOCKLIST = [w.strip() for w in os.getenv("PRESCREEN_BLOCKLIST", "").split(",") if w.strip()]
+# (선택) 로컬 분류기: "모듈:함수" 형식, 함수는 (title, mail)을 받아 수정이 필요할 확률(0~1)을 반환
+PRESCREEN_CLASSIFIER = os.getenv("PRESCREEN_CLASSIFIER")
+# 분류기 점수가 이 값 미만일 때만 모델 호출을 건너뜀
+PRESCREEN_CLASSIFIER_THRESHOLD = float(os.getenv("PRESCREEN_CLASSIFIER_THRESHOLD", "0.2"))
+# 건너뛴 모델 호출 1회당 절약한 시간으로 볼 기준값(초)
+# /filter/job의 모델 호출은 Celery 워커에서 일어나 API 프로세스에서는 평균을 측정할 수 없으므로 설정값을 우선 사용
+PRESCREEN_MODEL_LATENCY_SECONDS = os.getenv("PRESCREEN_MODEL_LATENCY_SECONDS")
+
+DEFAULT_BLOCKLIST = [
+    "씨발", "시발", "ㅅㅂ", "병신", "ㅂㅅ", "개새끼", "좆", "존나", "졸라", "닥쳐", "꺼져", "미친",
+    "fuck", "shit", "damn", "stupid", "idiot", "bitch",
+]
+
+
+def _load_classifier():
+    if not PRESCREEN_CLASSIFIER:
+        return None
+    module_name, _, func_name = PRESCREEN_CLASSIFIER.partition(":")
+    try:
+        return getattr(importlib.import_module(module_name), func_name)
+    except (ImportError, AttributeError):
+        logger.exception(f"Failed to load pre-screen classifier: {PRESCREEN_CLASSIFIER}")
+        return None
+
+
+_classifier = _load_classifier()
+
+
+# -------------------------
+# 빠른 경로 적중률 / 절약한 지연시간 집계
+# 프로세스 단위 값이며, 여러 워커 프로세스로 실행 중이면 각 프로세스의 값을 합산해서 봐야 함
+# 절약 시간 = 적중 수 x 기준 모델 지연시간 (설정값 → 없으면 이 프로세스의 평균 모델 지연시간)
+# -------------------------
+class PrescreenStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.hits = 0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+
+    def record_model_latency(self, seconds: float):
+        with self._lock:
+            self.model_calls += 1
+            self.model_seconds += seconds
+
+    def record_check(self, hit: bool):
+        with self._lock:
+            self.checked += 1
+            if hit:
+                self.hits += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            model_latency_avg = self.model_seconds / self.model_calls if self.model_calls else None
+            if PRESCREEN_MODEL_LATENCY_SECONDS is not None:
+                baseline, source = float(PRESCREEN_MODEL_LATENCY_SECONDS), "config"
+            elif model_latency_avg is not None:
+                baseline, source = model_latency_avg, "process_average"
+            else:
+                baseline, source = None, None
+            return {
+                "scope": "process",
+                "checked": self.checked,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.checked if self.checked else 0.0,
+                "model_calls": self.model_calls,
+                "model_latency_avg_seconds": model_latency_avg,
+                "latency_baseline_seconds": baseline,
+                "latency_baseline_source": source,
+                # 기준값이 없으면 계산할 수 없으므로 None (0으로 보고하지 않음)
+                "latency_saved_seconds": self.hits * baseline if baseline is not None else None,
+            }
+
+
+prescreen_stats = PrescreenStats()
+
+
+# -------------------------
+# 결정적(deterministic) 정리: 줄바꿈/줄 끝 공백/연속 빈 줄만 (문장부호와 들여쓰기는 그대로 유지)
+# -------------------------
+def _normalize(text: str) -> str:
+    text = text.replace("\r\n", "\n")
+    text = re.sub(r"[ \t]+\n", "\n", text)       # 줄 끝 공백
+    text = re.sub(r"\n{3,}", "\n\n", text)       # 연속 빈 줄
+    return text.lstrip("\n").rstrip()
+
+
+def _needs_model(title: str, text: str, guide: Optional[str], recipient, filter_keywords: Optional[List[str]]) -> bool:
+    # 수신자에 맞춘 수정(personalization)은 모델만 할 수 있음
+    if recipient:
+        return True
+    if guide or not title or not title.strip() or not text or not text.strip():
+        return True
+    if len(text) > PRESCREEN_MAX_CHARS:
+        return True
+
+    content = f"{title}\n{text}".lower()
+    for word in [*DEFAULT_BLOCKLIST, *PRESCREEN_BLOCKLIST, *(filter_keywords or [])]:
+        if word and word.lower() in content:
+            return True
+
+    if _classifier is not None:
+        try:
+            if _classifier(title, text) >= PRESCREEN_CLASSIFIER_THRESHOLD:
+                return True
+        except Exception:
+            logger.exception("Pre-screen classifier failed")
+            return True
+    return False
+
+
+# -------------------------
+# 사전 검사
+# 수정이 필요 없는 초안이면 결정적 정리만 적용한 결과를 반환, 모델이 필요하면 None
+# -------------------------
+def prescreen_draft(title: str = None, text: str = None, guide: str = None, recipient=None, filter_keywords: List[str] = None) -> Optional[dict]:
+    if not PRESCREEN_ENABLED:
+        return None
+
+    with tracer.start_as_current_span("prescreen") as span:
+        started = time.perf_counter()
+        hit = not _needs_model(title, text, guide, recipient, filter_keywords)
+        prescreen_stats.record_check(hit)
+        span.set_attribute("dearai.prescreen.hit", hit)
+        span.set_attribute("dearai.prescreen.seconds", time.perf_counter() - started)
+
+    if not hit:
+        return None
+    return {"title": _normalize(title), "mail": _normalize(text)}
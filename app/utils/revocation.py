@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+from app.utils.db import SessionLocal
+from app.utils.models import Revoked_tokens
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# 폐기 목록을 DB에서 다시 읽어 필터를 재구성하는 주기 (= 다른 프로세스의 폐기가 반영되기까지의 최대 지연)
+REVOCATION_REBUILD_SECONDS = int(os.getenv("REVOCATION_REBUILD_SECONDS", "60"))
+# 블룸 필터 오탐률 (오탐 시에만 DB 확인)
+REVOCATION_FALSE_POSITIVE_RATE = float(os.getenv("REVOCATION_FALSE_POSITIVE_RATE", "0.001"))
+REVOCATION_MIN_CAPACITY = 1024
+# 재사용 감지를 위해 프로세스마다 기억해 두는 최근 재발급된 jti 수
+REVOCATION_ROTATED_CACHE_SIZE = int(os.getenv("REVOCATION_ROTATED_CACHE_SIZE", "100000"))
+# 같은 refresh token의 재요청(네트워크 재시도, 여러 탭의 동시 재발급)을 정상으로 보고 같은 토큰을 돌려주는 시간
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
+
+
+# -------------------------
+# 블룸 필터
+# -------------------------
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # 더블 해싱: 128비트 다이제스트 하나로 k개의 위치 계산
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+# -------------------------
+# 폐기된 refresh token 세션 필터
+# 평소에는 메모리의 블룸 필터만 확인하고, 백그라운드 스레드가 주기적으로 revoked_tokens 테이블에서 재구성
+# 테이블에는 명시적 폐기(로그아웃, 재사용 감지, 관리자)만 기록되므로 회전(rotation) 자체는 DB를 쓰지 않음
+# -------------------------
+class RevocationFilter:
+    def __init__(self, rebuild_seconds: int):
+        self.rebuild_seconds = rebuild_seconds
+        self._bloom = None
+        self._recent = set()  # 재구성 중에 이 프로세스에서 폐기된 sid
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def rebuild(self):
+        with self._lock:
+            self._recent = set()
+
+        db = SessionLocal()
+        try:
+            # 세션의 마지막 토큰까지 만료된 행은 JWT 검증에서 이미 거부되므로 테이블에서 정리
+            db.query(Revoked_tokens).filter(
+                Revoked_tokens.time_expires <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+            sids = [row[0] for row in db.query(Revoked_tokens.sid).all()]
+        finally:
+            db.close()
+
+        bloom = BloomFilter(max(len(sids) * 2, REVOCATION_MIN_CAPACITY), REVOCATION_FALSE_POSITIVE_RATE)
+        for sid in sids:
+            bloom.add(sid)
+
+        with self._lock:
+            for sid in self._recent:
+                bloom.add(sid)
+            self._bloom = bloom
+        logger.info(f"Revocation filter rebuilt with {len(sids)} revoked sessions")
+
+    def _run(self):
+        while True:
+            time.sleep(self.rebuild_seconds)
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Failed to rebuild revocation filter")
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self.rebuild()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def might_be_revoked(self, sid: str) -> bool:
+        self._ensure_started()
+        return sid in self._bloom
+
+    def add(self, sid: str):
+        self._ensure_started()
+        with self._lock:
+            self._bloom.add(sid)
+            self._recent.add(sid)
+
+
+# -------------------------
+# 최근 재발급된 refresh token (프로세스 단위, best-effort 재사용 감지)
+# - 유예 시간 안에 같은 jti가 다시 오면 재시도로 보고 처음 발급한 토큰을 그대로 반환
+# - 유예 시간이 지난 뒤 다시 오면 탈취로 보고 None → 호출한 쪽에서 세션 전체를 폐기
+# 기록은 이 프로세스 메모리에만 있으므로 다른 프로세스나 재시작 후에는 이전 토큰이 만료(exp)까지 그대로 유효함
+# -------------------------
+class RotatedTokens:
+    def __init__(self, max_size: int, grace_seconds: int):
+        self.max_size = max_size
+        self.grace_seconds = grace_seconds
+        self._jtis = OrderedDict()  # jti → (재발급 시각, 발급한 토큰)
+        self._lock = threading.Lock()
+
+    def get_or_rotate(self, jti: str, issue):
+        """처음 재발급되는 jti면 issue()로 발급해 반환, 유예 시간 안의 재요청이면 같은 토큰, 그 뒤의 재사용이면 None"""
+        with self._lock:
+            now = time.monotonic()
+            if jti in self._jtis:
+                rotated_at, tokens = self._jtis[jti]
+                return tokens if now - rotated_at <= self.grace_seconds else None
+            tokens = issue()
+            self._jtis[jti] = (now, tokens)
+            if len(self._jtis) > self.max_size:
+                self._jtis.popitem(last=False)
+            return tokens
+
+
+# -------------------------
+# 사용자 존재 확인 캐시
+# 재구성 주기 동안은 같은 사용자에 대해 DB를 다시 조회하지 않음 (삭제된 사용자도 같은 지연 안에 거부)
+# -------------------------
+class KnownUsers:
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def is_fresh(self, user_id: str) -> bool:
+        with self._lock:
+            checked_at = self._checked.get(user_id)
+        return checked_at is not None and time.monotonic() - checked_at < self.ttl_seconds
+
+    def mark(self, user_id: str):
+        with self._lock:
+            now = time.monotonic()
+            # 만료된 항목 정리 (캐시가 무한히 커지지 않도록)
+            if len(self._checked) > REVOCATION_ROTATED_CACHE_SIZE:
+                self._checked = {k: v for k, v in self._checked.items() if now - v < self.ttl_seconds}
+            self._checked[user_id] = now
+
+
+revocation_filter = RevocationFilter(REVOCATION_REBUILD_SECONDS)
+rotated_tokens = RotatedTokens(REVOCATION_ROTATED_CACHE_SIZE, REFRESH_REUSE_GRACE_SECONDS)
+known_users = KnownUsers(REVOCATION_REBUILD_SECONDS)
@@ -0,0 +1,69 @@
+import os
+import json
+from dotenv import load_dotenv
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+# .env 로드
+load_dotenv()
+
+# 트레이싱 환경 변수
+# TRACE_EXPORTER: none | file | otlp | console (기본값 none → 스팬을 만들지만 내보내지 않음)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+# file 익스포터 사용 시 JSON Lines 형식으로 스팬을 기록할 경로
+# {pid}는 프로세스 id로 치환 (API/워커 프로세스의 버퍼 쓰기가 한 파일에서 섞이지 않도록)
+TRACE_FILE_PATH = os.getenv("TRACE_FILE_PATH", "traces-{pid}.jsonl")
+# otlp 익스포터 사용 시 수집기 주소 (OTLP/HTTP)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# 루트 스팬 샘플링 비율 (0.0 ~ 1.0), 하위 스팬은 부모의 샘플링 결정을 따름
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+
+_configured = False
+
+
+def _create_exporter():
+    if TRACE_EXPORTER == "file":
+        # 한 줄에 스팬 하나씩 기록 → 오프라인에서 단계별 지연시간 분석에 사용
+        return ConsoleSpanExporter(
+            out=open(TRACE_FILE_PATH.format(pid=os.getpid()), "a", encoding="utf-8"),
+            formatter=lambda span: json.dumps(json.loads(span.to_json()), ensure_ascii=False) + "\n",
+        )
+    if TRACE_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)
+    if TRACE_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+# -------------------------
+# 트레이서 프로바이더 설정 (프로세스당 1회)
+# -------------------------
+def setup_tracing(service_name: str):
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO)),
+    )
+    if exporter := _create_exporter():
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    # SQL 문 단위 스팬
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from app.utils.models import engine
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+
+    # Celery 발행/실행 스팬 + 메시지 헤더를 통한 컨텍스트 전파
+    from opentelemetry.instrumentation.celery import CeleryInstrumentor
+    CeleryInstrumentor().instrument()
+
+
+tracer = trace.get_tracer("dearai")
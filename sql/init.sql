@@ -46,4 +46,50 @@ CREATE TABLE results (
     input_id CHAR(36) NOT NULL,
     PRIMARY KEY (id),
     FOREIGN KEY (input_id) REFERENCES inputs(id)
-);
\ No newline at end of file
+);
+
+-- idempotency_keys 테이블 생성 (재시도된 요청에 원래 응답/작업 id를 재사용)
+CREATE TABLE idempotency_keys (
+    user_id CHAR(36) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    fingerprint CHAR(64) NOT NULL,
+    claim_token CHAR(36) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    response_data JSON NULL,
+    job_id CHAR(36) NULL,
+    time_created DATETIME NOT NULL,
+    time_expires DATETIME NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key),
+    INDEX idx_idempotency_keys_expires (time_expires),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+);
+
+
+-- revoked_tokens 테이블 생성 (명시적으로 폐기된 refresh token 세션 id, 로그아웃/재사용 감지/관리자 폐기 시에만 기록)
+CREATE TABLE revoked_tokens (
+    sid CHAR(36) NOT NULL,
+    user_id CHAR(36) NOT NULL,
+    reason VARCHAR(32) NOT NULL,
+    time_revoked DATETIME NOT NULL,
+    time_expires DATETIME NOT NULL,
+    PRIMARY KEY (sid),
+    INDEX idx_revoked_tokens_expires (time_expires)
+);
+
+
+-- jobs 테이블 생성 (비동기 작업 상태: QUEUED → RUNNING → SUCCEEDED | FAILED), id는 inputs.id와 동일
+CREATE TABLE jobs (
+    id CHAR(36) NOT NULL,
+    user_id CHAR(36) NOT NULL,
+    task_id CHAR(36) NULL,
+    status VARCHAR(16) NOT NULL,
+    error TEXT NULL,
+    time_created DATETIME NOT NULL,
+    time_started DATETIME NULL,
+    time_finished DATETIME NULL,
+    PRIMARY KEY (id),
+    INDEX idx_jobs_user_status_created (user_id, status, time_created),
+    INDEX idx_jobs_user_created (user_id, time_created),
+    FOREIGN KEY (id) REFERENCES inputs(id),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+);